@@ -0,0 +1,164 @@
+import gzip
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd support is optional
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+MEDIA_TYPES = {
+    "gzip": "application/gzip",
+    "zstd": "application/zstd",
+}
+FILE_SUFFIXES = {
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+
+class DecompressionError(ValueError):
+    """An upload looked compressed but could not be decompressed."""
+
+
+# errors raised while reading a corrupt compressed upload
+DECOMPRESSION_ERRORS = (DecompressionError, zlib.error, EOFError, gzip.BadGzipFile)
+if zstandard is not None:
+    DECOMPRESSION_ERRORS += (zstandard.ZstdError,)
+
+
+def supported_encodings():
+    return ["gzip", "zstd"] if zstandard is not None else ["gzip"]
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ValueError("zstd compression requires the 'zstandard' package")
+
+
+def open_xml(path):
+    """
+    Open an uploaded XML file for reading. gzip and zstd files are recognised
+    by their magic bytes and decompressed as a stream, so the raw XML is never
+    written to disk.
+    """
+    with open(path, "rb") as fh:
+        magic = fh.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, "rb")
+    if magic.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise DecompressionError("zstd compression requires the 'zstandard' package")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return open(path, "rb")
+
+
+class StreamDecompressor:
+    """
+    Chunk-by-chunk counterpart of open_xml for uploads that are still arriving:
+    feed() returns whatever XML the chunk decompresses to (the chunk itself for
+    plain XML), flush() whatever is left once the upload has ended.
+    """
+
+    def __init__(self):
+        self._head = b""
+        self._decompress = None
+
+    def feed(self, data):
+        if self._decompress is None:
+            self._head += data
+            if len(self._head) < len(ZSTD_MAGIC):
+                return b""
+            data, self._head = self._head, b""
+            self._decompress = self._select(data)
+        return self._run(data)
+
+    def flush(self):
+        if self._decompress is None:
+            data, self._head = self._head, b""
+            self._decompress = self._select(data)
+            return self._run(data)
+        if isinstance(self._decompress, _MultiFrameStream) and not self._decompress.finished:
+            raise DecompressionError("Could not decompress upload: compressed data is truncated")
+        return b""
+
+    def _run(self, data):
+        try:
+            return self._decompress(data)
+        except DECOMPRESSION_ERRORS as e:
+            raise DecompressionError(f"Could not decompress upload: {e}") from e
+
+    @staticmethod
+    def _select(head):
+        if head.startswith(GZIP_MAGIC):
+            return _MultiFrameStream(lambda: zlib.decompressobj(wbits=31))
+        if head.startswith(ZSTD_MAGIC):
+            if zstandard is None:
+                raise DecompressionError("zstd compression requires the 'zstandard' package")
+            return _MultiFrameStream(lambda: zstandard.ZstdDecompressor().decompressobj())
+        return bytes
+
+
+class _MultiFrameStream:
+    """
+    Each decompressobj stops at the end of its gzip member / zstd frame.
+    Files made of several (`cat a.gz b.gz`, pzstd, seekable zstd) continue in
+    unused_data, which is fed to a fresh decompressobj.
+    """
+
+    def __init__(self, new_decompressobj):
+        self._new = new_decompressobj
+        self._d = new_decompressobj()
+
+    @property
+    def finished(self):
+        return self._d.eof
+
+    def __call__(self, data):
+        out = []
+        while data:
+            # a frame may end exactly at a chunk boundary, so the next frame
+            # can start in a later call as well as in unused_data
+            if self._d.eof:
+                self._d = self._new()
+            out.append(self._d.decompress(data))
+            data = self._d.unused_data if self._d.eof else b""
+        return b"".join(out)
+
+
+def compressing_writer(fileobj, encoding):
+    """Wrap fileobj so that everything written to it is compressed with encoding."""
+    if encoding == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=6)
+    if encoding == "zstd":
+        _require_zstandard()
+        return zstandard.ZstdCompressor().stream_writer(fileobj, closefd=False)
+    raise ValueError(f"Unsupported compression: {encoding}")
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Pick the supported content coding with the highest q-value in an
+    Accept-Encoding header; zstd only wins ties. Returns None when the
+    response should be sent uncompressed.
+    """
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        token, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if token:
+            accepted[token.lower()] = q
+    candidates = [
+        (accepted.get(encoding, accepted.get("*", 0)), encoding == "zstd", encoding)
+        for encoding in supported_encodings()
+    ]
+    q, _, encoding = max(candidates)
+    return encoding if q > 0 else None
@@ -0,0 +1,23 @@
+# Pre-fork deployment: gunicorn imports main.py once in the master, which loads
+# the active model before any worker exists. Workers are forked afterwards and
+# share the model pages copy-on-write instead of each unpickling a private copy.
+#
+#   gunicorn -c gunicorn.conf.py main:app
+import gc
+import multiprocessing
+import os
+
+os.environ.setdefault("EDC_MODEL_LOADING", "preload")
+
+bind = os.environ.get("EDC_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("EDC_WORKERS", multiprocessing.cpu_count()))
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+
+
+def when_ready(server):
+    # Move everything allocated so far (the model included) out of the
+    # collector's reach, so a GC pass in a worker does not write to the
+    # shared pages and force them to be copied.
+    gc.collect()
+    gc.freeze()
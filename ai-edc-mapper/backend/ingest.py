@@ -0,0 +1,200 @@
+import os
+import queue
+import threading
+import uuid
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from compression import StreamDecompressor, DecompressionError
+
+# chunks buffered between the request loop and a file's writer/parser thread
+QUEUE_SIZE = 64
+
+
+def unique_upload_path(upload_folder, filename):
+    """
+    Path under upload_folder for a new upload. The random prefix gives every
+    upload its own file, so concurrent uploads sharing a client filename never
+    write to, or export, each other's data.
+    """
+    return os.path.join(upload_folder, f"{uuid.uuid4().hex}_{os.path.basename(filename)}")
+
+
+def discard_upload(path):
+    """Delete a stored upload that is no longer needed."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class IngestError(ValueError):
+    """The request body is not a well-formed multipart/form-data upload."""
+
+
+class IngestedFile:
+    """
+    One uploaded file, written to `path` by a background thread while the
+    request body is still arriving. If a parser was attached, the raw bytes
+    are also decompressed and fed into it, and `records` holds its result
+    once the upload is finished.
+    """
+
+    def __init__(self, filename, path, parser=None):
+        self.filename = filename
+        self.path = path
+        self.records = None
+        self._parser = parser
+        self._decompressor = StreamDecompressor() if parser is not None else None
+        self._error = None
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name=f"ingest-{filename}", daemon=True)
+        self._thread.start()
+
+    async def put(self, data):
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            # parser is behind: wait for room without blocking the event loop
+            await run_in_threadpool(self._queue.put, data)
+
+    async def finish(self):
+        await self.put(None)
+        await run_in_threadpool(self._thread.join)
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        with open(self.path, "wb") as fh:
+            while True:
+                data = self._queue.get()
+                if data is None:
+                    break
+                fh.write(data)
+                if self._parser is not None and self._error is None:
+                    try:
+                        self._parser.feed(self._decompressor.feed(data))
+                    except DecompressionError as e:
+                        self._error = IngestError(str(e))
+                    except Exception as e:
+                        # keep draining so the request loop never blocks on us
+                        self._error = e
+        if self._parser is not None and self._error is None:
+            try:
+                self._parser.feed(self._decompressor.flush())
+                self.records = self._parser.close()
+            except DecompressionError as e:
+                self._error = IngestError(str(e))
+            except Exception as e:
+                self._error = e
+
+
+async def ingest_multipart(request, upload_folder, parsers):
+    """
+    Read a multipart/form-data request body chunk by chunk. Every file field is
+    teed to its own file in upload_folder (see unique_upload_path), and the
+    fields named in `parsers` (field name -> parser factory, e.g.
+    ODMStreamParser) are parsed while the rest of the body is still being
+    received, so parsing overlaps with the upload instead of starting after it.
+
+    Returns {field name: IngestedFile}. Parse errors raised by a parser (such
+    as ET.ParseError) are re-raised once the body has been consumed. On any
+    failure the files written for this request are deleted again.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise IngestError("Expected a multipart/form-data request")
+
+    files = {}
+    pending = []
+    headers = {}
+    header = {"field": b"", "value": b""}
+    current = {"file": None, "complete": False}
+
+    def on_part_begin():
+        headers.clear()
+        current["file"] = None
+
+    def on_header_field(data, start, end):
+        header["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        headers[header["field"].lower()] = header["value"]
+        header["field"] = header["value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+        name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        filename = disposition.get(b"filename")
+        if filename is None or name in files:
+            # plain form fields and repeated file fields are not used by the API
+            return
+        filename = os.path.basename(filename.decode("utf-8", "replace"))
+        if not filename:
+            return
+        parser_factory = parsers.get(name)
+        current["file"] = files[name] = IngestedFile(
+            filename,
+            unique_upload_path(upload_folder, filename),
+            parser_factory() if parser_factory is not None else None,
+        )
+
+    def on_part_data(data, start, end):
+        if current["file"] is not None:
+            pending.append((current["file"], bytes(data[start:end])))
+
+    def on_part_end():
+        current["file"] = None
+
+    def on_end():
+        current["complete"] = True
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_end": on_end,
+    })
+
+    failed = True
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except Exception as e:
+                raise IngestError(f"Malformed multipart body: {e}") from e
+            for ingested, data in pending:
+                await ingested.put(data)
+            pending.clear()
+        parser.finalize()
+        if not current["complete"]:
+            # the body stopped before its closing boundary, so the last file is cut short
+            raise IngestError("Malformed multipart body: missing closing boundary")
+        failed = False
+    finally:
+        # always stop the writer threads, also when the client disconnects
+        errors = []
+        for ingested in files.values():
+            try:
+                await ingested.finish()
+            except Exception as e:
+                errors.append(e)
+        if failed or errors:
+            for ingested in files.values():
+                discard_upload(ingested.path)
+    if errors:
+        raise errors[0]
+    return files
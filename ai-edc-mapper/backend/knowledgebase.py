@@ -1,7 +1,36 @@
 import json
 import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 KNOWLEDGE_DB = "knowledge_db.json"
+KNOWLEDGE_DB_LOCK = f"{KNOWLEDGE_DB}.lock"
+
+@contextmanager
+def db_lock():
+    """
+    Exclusive lock on the knowledge DB, shared by all worker processes. Hold it
+    across every load-modify-save so concurrent writers do not lose updates.
+    """
+    with open(KNOWLEDGE_DB_LOCK, "a+") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        else:
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
 
 def load_db():
     if os.path.exists(KNOWLEDGE_DB):
@@ -10,14 +39,17 @@ def load_db():
     return {"models": [], "activities": [], "mappings_total": 0, "last_export": None}
 
 def save_db(db):
-    with open(KNOWLEDGE_DB, "w", encoding="utf-8") as fh:
+    tmp_path = f"{KNOWLEDGE_DB}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
         json.dump(db, fh, indent=2, default=str)
+    os.replace(tmp_path, KNOWLEDGE_DB)
 
 def add_user_mapping(mapping):
-    db = load_db()
-    # mappings can be validated/normalized
-    db.setdefault("user_corrected", []).append(mapping)
-    save_db(db)
+    with db_lock():
+        db = load_db()
+        # mappings can be validated/normalized
+        db.setdefault("user_corrected", []).append(mapping)
+        save_db(db)
     return db
 
 def get_all_user_mappings():
@@ -1,21 +1,43 @@
-from fastapi import FastAPI, UploadFile, File, Body
+from fastapi import FastAPI, UploadFile, File, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from model import train_model, predict_mappings, validate_view_mapping, load_model, save_model
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager, contextmanager
 from xml_updater import update_odm_xml, get_update_response
-from knowledgebase import add_user_mapping, get_all_user_mappings
+from knowledgebase import add_user_mapping, get_all_user_mappings, db_lock
+from sessions import create_session, get_session, prune_sessions
+from ingest import ingest_multipart, unique_upload_path, discard_upload, IngestError
+from mapping_utils import ODMStreamParser
+from compression import negotiate_encoding, supported_encodings, MEDIA_TYPES, FILE_SUFFIXES, DECOMPRESSION_ERRORS
 
 import shutil
 import os
 import xml.etree.ElementTree as ET
 import logging
 import json
+import threading
+import uuid
 from datetime import datetime
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# How the active model is brought into memory:
+#   lazy       - on the first request that needs it
+#   background - in a thread started at app startup (default)
+#   preload    - at import time, i.e. once in a pre-fork master (see gunicorn.conf.py)
+# model.py pulls in pandas/scikit-learn, so it is only imported when a model
+# is actually loaded or trained.
+MODEL_LOADING = os.environ.get("EDC_MODEL_LOADING", "background")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if MODEL_LOADING == "background":
+        _start_model_warmup()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,8 +54,11 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(MODELS_DIR, exist_ok=True)
 
 global_model = None
-latest_odm_path = None
-corrected_mappings = []
+global_model_path = None
+_model_lock = threading.Lock()
+# (model_path, reason) of the last failed load, reported by /readyz/
+_model_error = None
+_warmup_thread = None
 
 def _load_db():
     if os.path.exists("knowledge_db.json"):
@@ -52,31 +77,100 @@ def _load_db():
 
 def _save_db(db):
     try:
-        with open("knowledge_db.json", "w", encoding="utf-8") as fh:
+        # replace atomically so other workers never read a half-written file
+        tmp_path = f"knowledge_db.json.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
             json.dump(db, fh, indent=2, default=str)
+        os.replace(tmp_path, "knowledge_db.json")
     except Exception:
         logger.exception("Failed to save knowledge DB")
 
+@contextmanager
+def _locked_db():
+    # load, let the caller modify, and save the knowledge DB while holding the
+    # cross-process lock, so updates from other workers are never overwritten
+    with db_lock():
+        db = _load_db()
+        yield db
+        _save_db(db)
+
+def _registered_model_path(db):
+    return db["models"][-1].get("model_path") if db["models"] else None
+
 def ensure_model_loaded():
-    global global_model
-    db = _load_db()
-    if db["models"]:
-        last = db["models"][-1]
-        model_path = last.get("model_path")
+    """
+    Make sure global_model holds the latest registered model. The pickle is only
+    read again when the registered path changes, so workers forked from a
+    preloading master keep sharing its copy instead of unpickling their own.
+    """
+    global global_model, global_model_path, _model_error
+    model_path = _registered_model_path(_load_db())
+    if global_model is not None and model_path == global_model_path:
+        return
+    with _model_lock:
+        if global_model is not None and model_path == global_model_path:
+            return
+        _model_error = None
         if model_path and os.path.exists(model_path):
             try:
+                from model import load_model
                 global_model = load_model(model_path)
+                global_model_path = model_path
                 logger.debug(f"Loaded model from {model_path}")
                 return
-            except Exception:
+            except Exception as e:
                 logger.exception("Failed to load saved model")
-    global_model = None
+                _model_error = (model_path, f"Failed to load model: {e}")
+        elif model_path:
+            logger.warning(f"Registered model {model_path} does not exist")
+            _model_error = (model_path, "Model file not found")
+        global_model = None
+        global_model_path = None
+
+def _start_model_warmup():
+    """Load the model in a background thread, unless one is already doing so."""
+    global _warmup_thread
+    if _warmup_thread is None or not _warmup_thread.is_alive():
+        _warmup_thread = threading.Thread(target=ensure_model_loaded, name="model-warmup", daemon=True)
+        _warmup_thread.start()
+
+def _multipart_body(*fields):
+    # /train/ and /predict/ read their multipart body themselves (see ingest.py),
+    # so the expected file fields are declared here for the OpenAPI docs
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "required": list(fields),
+        "properties": {field: {"type": "string", "format": "binary"} for field in fields},
+    }}}}}
+
+if MODEL_LOADING == "preload":
+    ensure_model_loaded()
+
+@app.get("/healthz/")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
 
-ensure_model_loaded()
+@app.get("/readyz/")
+async def readyz():
+    """
+    Readiness: the latest registered model is in memory (or none has been
+    trained yet). A stale worker starts loading it in the background and
+    reports 503 until it is warm, so it recovers without needing traffic.
+    A registered model that cannot be loaded is reported as unavailable
+    rather than keeping the worker out of rotation; /train/ still works.
+    """
+    model_path = _registered_model_path(_load_db())
+    if not model_path or (global_model is not None and model_path == global_model_path):
+        return {"status": "ready", "model_path": model_path}
+    if _model_error is not None and _model_error[0] == model_path:
+        return {"status": "model_unavailable", "model_path": model_path, "error": _model_error[1]}
+    _start_model_warmup()
+    return JSONResponse(status_code=503, content={"status": "warming", "model_path": model_path})
 
 @app.get("/model_status/")
 async def model_status():
-    ensure_model_loaded()
+    await run_in_threadpool(ensure_model_loaded)
     db = _load_db()
     latest = db["models"][-1] if db["models"] else None
     return {
@@ -84,19 +178,23 @@ async def model_status():
         "latest_model": latest
     }
 
-@app.post("/train/")
-async def train(odm: UploadFile = File(...), viewmap: UploadFile = File(...)):
-    odm_path = os.path.join(UPLOAD_FOLDER, odm.filename)
-    viewmap_path = os.path.join(UPLOAD_FOLDER, viewmap.filename)
-
-    with open(odm_path, "wb") as f:
-        shutil.copyfileobj(odm.file, f)
-    with open(viewmap_path, "wb") as f:
-        shutil.copyfileobj(viewmap.file, f)
-
-    global global_model
+@app.post("/train/", openapi_extra=_multipart_body("odm", "viewmap"))
+async def train(request: Request):
+    global global_model, global_model_path
+    uploads = {}
     try:
-        trained_model = train_model(odm_path, viewmap_path)
+        # the ODM is parsed while it is still being uploaded
+        uploads = await ingest_multipart(request, UPLOAD_FOLDER, {"odm": ODMStreamParser})
+        odm, viewmap = uploads.get("odm"), uploads.get("viewmap")
+        if odm is None or viewmap is None:
+            return JSONResponse(status_code=400, content={"error": "Both odm and viewmap files are required"})
+
+        from model import train_model
+        trained_model = train_model(odm.path, viewmap.path, odm_mappings=odm.records)
+    except IngestError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except DECOMPRESSION_ERRORS as e:
+        return JSONResponse(status_code=400, content={"error": f"Could not decompress upload: {e}"})
     except ET.ParseError as e:
         line = getattr(e, "position", ("Unknown", "Unknown"))[0]
         col = getattr(e, "position", ("Unknown", "Unknown"))[1]
@@ -105,62 +203,75 @@ async def train(odm: UploadFile = File(...), viewmap: UploadFile = File(...)):
     except Exception as e:
         logger.exception("Training failed")
         return JSONResponse(status_code=500, content={"error": str(e)})
+    finally:
+        # the trained model holds everything it needs from the files
+        for upload in uploads.values():
+            discard_upload(upload.path)
 
-    db = _load_db()
-    version = len(db["models"]) + 1
-    model_filename = f"model_v{version}.pkl"
-    model_path = os.path.join(MODELS_DIR, model_filename)
+    # unique file name: workers training at the same time must not overwrite
+    # each other's model; the version number is assigned under the DB lock
+    model_path = os.path.join(MODELS_DIR, f"model_{uuid.uuid4().hex}.pkl")
 
     try:
+        from model import save_model
         save_model(trained_model, model_path)
     except Exception:
         logger.exception("Failed to save trained model")
         return JSONResponse(status_code=500, content={"error": "Failed to save trained model"})
 
     metadata = trained_model.get("metadata", {})
-    metadata_entry = {
-        "version": version,
-        "trained_at": datetime.utcnow().isoformat(),
-        "odm_filename": odm.filename,
-        "viewmap_filename": viewmap.filename,
-        "model_path": model_path,
-        "train_samples": metadata.get("train_samples", None),
-        "mappings_count": metadata.get("mappings_count", None),
-        "accuracy_estimate": metadata.get("accuracy_estimate", None),
-        "notes": metadata.get("notes", "")
-    }
-
-    db["models"].append(metadata_entry)
-    db["activities"].insert(0, {
-        "time": datetime.utcnow().isoformat(),
-        "type": "train",
-        "message": f"Trained model v{version} from {odm.filename}"
-    })
-    _save_db(db)
+    with _locked_db() as db:
+        version = len(db["models"]) + 1
+        metadata_entry = {
+            "version": version,
+            "trained_at": datetime.utcnow().isoformat(),
+            "odm_filename": odm.filename,
+            "viewmap_filename": viewmap.filename,
+            "model_path": model_path,
+            "train_samples": metadata.get("train_samples", None),
+            "mappings_count": metadata.get("mappings_count", None),
+            "accuracy_estimate": metadata.get("accuracy_estimate", None),
+            "notes": metadata.get("notes", "")
+        }
+
+        db["models"].append(metadata_entry)
+        db["activities"].insert(0, {
+            "time": datetime.utcnow().isoformat(),
+            "type": "train",
+            "message": f"Trained model v{version} from {odm.filename}"
+        })
 
     global_model = trained_model
+    global_model_path = model_path
 
     return {"status": "trained", "version": version, "metadata": metadata_entry}
 
-@app.post("/predict/")
-async def predict(testodm: UploadFile = File(...)):
-    ensure_model_loaded()
+@app.post("/predict/", openapi_extra=_multipart_body("testodm"))
+async def predict(request: Request):
+    await run_in_threadpool(ensure_model_loaded)
     if global_model is None:
         return JSONResponse(status_code=400, content={"error": "Model not trained."})
 
-    test_path = os.path.join(UPLOAD_FOLDER, testodm.filename)
-    with open(test_path, "wb") as f:
-        shutil.copyfileobj(testodm.file, f)
-
+    uploads = {}
+    keep_upload = False
     try:
-        odm_mappings = None
-        from mapping_utils import parse_odm_file
-        odm_mappings = parse_odm_file(test_path)
+        # records are extracted while the upload is in progress and shared by
+        # the prediction and the unmapped listing below
+        uploads = await ingest_multipart(request, UPLOAD_FOLDER, {"testodm": ODMStreamParser})
+        testodm = uploads.get("testodm")
+        if testodm is None:
+            return JSONResponse(status_code=400, content={"error": "testodm file is required"})
+        odm_mappings = testodm.records
 
-        result = predict_mappings(global_model, test_path)
+        from model import predict_mappings
+        result = predict_mappings(global_model, testodm.path, odm_mappings=odm_mappings)
 
         mapped_keys = set((item["StudyEventOID"], item["ItemOID"]) for item in result)
         unmapped = [entry for entry in odm_mappings if (entry["StudyEventOID"], entry["ItemOID"]) not in mapped_keys]
+        # kept for /save_mappings/ + /export_xml/; prune_sessions ages it out if never saved
+        keep_upload = True
+    except IngestError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     except ET.ParseError as e:
         line = getattr(e, "position", ("Unknown", "Unknown"))[0]
         col = getattr(e, "position", ("Unknown", "Unknown"))[1]
@@ -169,29 +280,37 @@ async def predict(testodm: UploadFile = File(...)):
     except Exception as e:
         logger.exception("Prediction failed")
         return JSONResponse(status_code=500, content={"error": str(e)})
+    finally:
+        for name, upload in uploads.items():
+            if not (keep_upload and name == "testodm"):
+                discard_upload(upload.path)
 
-    db = _load_db()
-    db["activities"].insert(0, {
-        "time": datetime.utcnow().isoformat(),
-        "type": "predict",
-        "message": f"Predicted mappings for {testodm.filename} ({len(result)} rows)"
-    })
-    _save_db(db)
+    prune_sessions(UPLOAD_FOLDER)
+
+    with _locked_db() as db:
+        db["activities"].insert(0, {
+            "time": datetime.utcnow().isoformat(),
+            "type": "predict",
+            "message": f"Predicted mappings for {testodm.filename} ({len(result)} rows)"
+        })
 
-    return {"mapped": result, "unmapped": unmapped}
+    # odm_filename names the stored upload; /save_mappings/ takes it to export this exact file
+    return {"mapped": result, "unmapped": unmapped, "odm_filename": os.path.basename(testodm.path)}
 
 @app.post("/validate/")
 async def validate(user_viewmap: UploadFile = File(...)):
-    ensure_model_loaded()
+    await run_in_threadpool(ensure_model_loaded)
     if global_model is None:
         return JSONResponse(status_code=400, content={"error": "Model not trained."})
 
-    user_viewmap_path = os.path.join(UPLOAD_FOLDER, user_viewmap.filename)
-    with open(user_viewmap_path, "wb") as f:
-        shutil.copyfileobj(user_viewmap.file, f)
-
+    user_viewmap_path = unique_upload_path(UPLOAD_FOLDER, user_viewmap.filename)
     try:
+        with open(user_viewmap_path, "wb") as f:
+            shutil.copyfileobj(user_viewmap.file, f)
+        from model import validate_view_mapping
         validation_results = validate_view_mapping(global_model, user_viewmap_path)
+    except DECOMPRESSION_ERRORS as e:
+        return JSONResponse(status_code=400, content={"error": f"Could not decompress upload: {e}"})
     except ET.ParseError as e:
         line = getattr(e, "position", ("Unknown", "Unknown"))[0]
         col = getattr(e, "position", ("Unknown", "Unknown"))[1]
@@ -200,6 +319,8 @@ async def validate(user_viewmap: UploadFile = File(...)):
     except Exception as e:
         logger.exception("Validation failed")
         return JSONResponse(status_code=500, content={"error": str(e)})
+    finally:
+        discard_upload(user_viewmap_path)
 
     # compute simple summary
     total = len(validation_results)
@@ -208,24 +329,23 @@ async def validate(user_viewmap: UploadFile = File(...)):
     if total > 0:
         accuracy = round(((total - wrongly) / total) * 100, 2)
 
-    db = _load_db()
-    db["activities"].insert(0, {
-        "time": datetime.utcnow().isoformat(),
-        "type": "validate",
-        "message": f"Validated {user_viewmap.filename} (total={total}, wrong={wrongly})"
-    })
-    # update knowledge DB approx accuracy (store simple rolling average)
-    if db["models"]:
-        last_model = db["models"][-1]
-        # store last validation summary inside model metadata for quick reference
-        last_model.setdefault("validations", []).append({
+    with _locked_db() as db:
+        db["activities"].insert(0, {
             "time": datetime.utcnow().isoformat(),
-            "file": user_viewmap.filename,
-            "total": total,
-            "wrong": wrongly,
-            "accuracy": accuracy
+            "type": "validate",
+            "message": f"Validated {user_viewmap.filename} (total={total}, wrong={wrongly})"
         })
-    _save_db(db)
+        # update knowledge DB approx accuracy (store simple rolling average)
+        if db["models"]:
+            last_model = db["models"][-1]
+            # store last validation summary inside model metadata for quick reference
+            last_model.setdefault("validations", []).append({
+                "time": datetime.utcnow().isoformat(),
+                "file": user_viewmap.filename,
+                "total": total,
+                "wrong": wrongly,
+                "accuracy": accuracy
+            })
 
     return {"validation": validation_results, "summary": {"total": total, "wrong": wrongly, "accuracy": accuracy}}
 
@@ -235,56 +355,74 @@ async def save_mappings(
     mappings: list[dict] = Body(...),
     odm_filename: str = None
 ):
-    global corrected_mappings, latest_odm_path
-
     if odm_filename is None:
         return JSONResponse(status_code=400, content={"error": "ODM filename required"})
 
-    odm_path = os.path.join(UPLOAD_FOLDER, odm_filename)
+    odm_path = os.path.join(UPLOAD_FOLDER, os.path.basename(odm_filename))
     if not os.path.exists(odm_path):
         return JSONResponse(status_code=400, content={"error": "ODM file not found"})
 
-    corrected_mappings = mappings
-    latest_odm_path = odm_path
+    session_id = create_session(odm_path, mappings)
 
     for mapping in mappings:
         add_user_mapping(mapping)
 
     # Optionally retrain model with added mappings could be implemented here
 
-    db = _load_db()
-    db["activities"].insert(0, {
-        "time": datetime.utcnow().isoformat(),
-        "type": "save_mappings",
-        "message": f"Saved {len(mappings)} corrected mappings for {odm_filename}"
-    })
-    db["mappings_total"] = db.get("mappings_total", 0) + len(mappings)
-    _save_db(db)
+    with _locked_db() as db:
+        db["activities"].insert(0, {
+            "time": datetime.utcnow().isoformat(),
+            "type": "save_mappings",
+            "message": f"Saved {len(mappings)} corrected mappings for {odm_filename}"
+        })
+        db["mappings_total"] = db.get("mappings_total", 0) + len(mappings)
 
-    return {"status": "mappings saved"}
+    return {"status": "mappings saved", "session_id": session_id}
 
 @app.get("/export_xml/")
-async def export_xml():
+async def export_xml(request: Request, session_id: str = None, compress: str = None):
     """
-    Generate updated ODM XML using the latest corrected_mappings and offer it
-    as a streaming download response using xml_updater helpers.
+    Generate updated ODM XML from the corrected mappings saved under session_id
+    (returned by /save_mappings/) and offer it as a streaming download response
+    using xml_updater helpers.
+
+    compress=gzip|zstd downloads a compressed file (updated_odm.xml.gz/.zst).
+    Otherwise the body is compressed with the best coding the client lists in
+    Accept-Encoding and sent with a matching Content-Encoding header.
     """
-    global corrected_mappings, latest_odm_path
-    if latest_odm_path is None:
+    if compress is not None and compress not in supported_encodings():
+        return JSONResponse(status_code=400, content={
+            "error": f"Unsupported compression '{compress}', expected one of {supported_encodings()}"
+        })
+    if session_id is None:
+        return JSONResponse(status_code=400, content={"error": "session_id required"})
+    session = get_session(session_id)
+    if session is None:
+        return JSONResponse(status_code=404, content={"error": "Export session not found"})
+    odm_path = session["odm_path"]
+    if not os.path.exists(odm_path):
         return JSONResponse(status_code=400, content={"error": "No ODM file found to export"})
 
     try:
-        xml_content = update_odm_xml(latest_odm_path, corrected_mappings)
+        content_encoding = None
+        if compress is None:
+            content_encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        xml_chunks = update_odm_xml(odm_path, session["mappings"], encoding=compress or content_encoding)
         # persist last export timestamp
-        db = _load_db()
-        db["last_export"] = datetime.utcnow().isoformat()
-        db["activities"].insert(0, {
-            "time": datetime.utcnow().isoformat(),
-            "type": "export",
-            "message": f"Exported updated ODM for {os.path.basename(latest_odm_path)}"
-        })
-        _save_db(db)
-        return get_update_response(xml_content)
+        with _locked_db() as db:
+            db["last_export"] = datetime.utcnow().isoformat()
+            db["activities"].insert(0, {
+                "time": datetime.utcnow().isoformat(),
+                "type": "export",
+                "message": f"Exported updated ODM for {os.path.basename(odm_path)}"
+            })
+        if compress is not None:
+            return get_update_response(
+                xml_chunks,
+                filename=f"updated_odm.xml{FILE_SUFFIXES[compress]}",
+                media_type=MEDIA_TYPES[compress],
+            )
+        return get_update_response(xml_chunks, content_encoding=content_encoding)
     except Exception as e:
         logger.exception("Error generating updated XML")
         return JSONResponse(status_code=500, content={"error": f"Error generating updated XML: {str(e)}"})
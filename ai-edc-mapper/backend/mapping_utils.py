@@ -1,42 +1,95 @@
 import xml.etree.ElementTree as ET
 import logging
+from compression import open_xml
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-def parse_odm_file(file_path):
-    logger.info(f"Parsing ODM file: {file_path}")
-    tree = ET.parse(file_path)
-    root = tree.getroot()
+CHUNK_SIZE = 64 * 1024
 
-    ns = {'ns': root.tag[root.tag.find("{")+1:root.tag.find("}")]} if "{" in root.tag else {}
-    logger.debug(f"Namespace detected: {ns}")
 
-    odm_mappings = []
-    for subject in root.findall(".//ns:SubjectData", ns) if ns else root.findall(".//SubjectData"):
-        subject_key = subject.attrib.get("SubjectKey")
-        logger.debug(f"SubjectKey: {subject_key}")
-        for study_event in subject.findall(".//ns:StudyEventData", ns) if ns else subject.findall(".//StudyEventData"):
-            study_event_oid = study_event.attrib.get("StudyEventOID")
-            study_event_repeat_key = study_event.attrib.get("StudyEventRepeatKey")
-            logger.debug(f"StudyEventOID: {study_event_oid}, StudyEventRepeatKey: {study_event_repeat_key}")
-            for form_data in study_event.findall(".//ns:FormData", ns) if ns else study_event.findall(".//FormData"):
-                for item_group in form_data.findall(".//ns:ItemGroupData", ns) if ns else form_data.findall(".//ItemGroupData"):
-                    for item_data in item_group.findall(".//ns:ItemData", ns) if ns else item_group.findall(".//ItemData"):
-                        item_oid = item_data.attrib.get("ItemOID")
-                        if study_event_oid and item_oid:
-                            odm_mappings.append({
-                                "SubjectKey": subject_key,
-                                "StudyEventOID": study_event_oid,
-                                "StudyEventRepeatKey": study_event_repeat_key,
-                                "ItemOID": item_oid
-                            })
-    logger.info(f"parse_odm_file extracted {len(odm_mappings)} mappings with additional fields")
-    return odm_mappings
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+class ODMStreamParser:
+    """
+    Incremental ODM parser: feed() it XML as it arrives (e.g. while an upload
+    is still in progress) and close() returns the same records as
+    parse_odm_file. Finished SubjectData elements are cleared, so memory stays
+    flat however large the file is.
+    """
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._subject_key = None
+        self._subject_depth = 0
+        self._study_events = []
+        self._form_depth = 0
+        self._item_group_depth = 0
+        self.records = []
+
+    def feed(self, data):
+        if data:
+            self._parser.feed(data)
+            self._drain()
+
+    def close(self):
+        self._parser.close()
+        self._drain()
+        logger.info(f"parse_odm_file extracted {len(self.records)} mappings with additional fields")
+        return self.records
+
+    def _drain(self):
+        for event, elem in self._parser.read_events():
+            tag = _local_name(elem.tag)
+            if event == "start":
+                if tag == "SubjectData":
+                    self._subject_depth += 1
+                    self._subject_key = elem.attrib.get("SubjectKey")
+                    logger.debug(f"SubjectKey: {self._subject_key}")
+                elif tag == "StudyEventData" and self._subject_depth:
+                    self._study_events.append(
+                        (elem.attrib.get("StudyEventOID"), elem.attrib.get("StudyEventRepeatKey"))
+                    )
+                elif tag == "FormData":
+                    self._form_depth += 1
+                elif tag == "ItemGroupData":
+                    self._item_group_depth += 1
+                elif tag == "ItemData" and self._study_events and self._form_depth and self._item_group_depth:
+                    study_event_oid, study_event_repeat_key = self._study_events[-1]
+                    item_oid = elem.attrib.get("ItemOID")
+                    if study_event_oid and item_oid:
+                        self.records.append({
+                            "SubjectKey": self._subject_key,
+                            "StudyEventOID": study_event_oid,
+                            "StudyEventRepeatKey": study_event_repeat_key,
+                            "ItemOID": item_oid
+                        })
+            else:
+                if tag == "SubjectData":
+                    self._subject_depth -= 1
+                    elem.clear()
+                elif tag == "StudyEventData" and self._subject_depth:
+                    self._study_events.pop()
+                elif tag == "FormData":
+                    self._form_depth -= 1
+                elif tag == "ItemGroupData":
+                    self._item_group_depth -= 1
+
+
+def parse_odm_file(file_path):
+    logger.info(f"Parsing ODM file: {file_path}")
+    parser = ODMStreamParser()
+    with open_xml(file_path) as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+            parser.feed(chunk)
+    return parser.close()
 
 def parse_view_mapping_file(file_path):
     logger.info(f"Parsing ViewMapping file: {file_path}")
-    tree = ET.parse(file_path)
+    with open_xml(file_path) as fh:
+        tree = ET.parse(fh)
     root = tree.getroot()
 
     ns = {'ns': root.tag[root.tag.find("{")+1:root.tag.find("}")]} if "{" in root.tag else {}
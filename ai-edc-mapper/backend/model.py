@@ -46,17 +46,21 @@ def load_model(path: str = None):
     return obj
 
 
-def train_model(odm_path: str, viewmap_path: str) -> dict:
+def train_model(odm_path: str, viewmap_path: str, odm_mappings: list = None) -> dict:
     """
     Train two RandomForest models:
       - model_visit predicts IMPACTVisitID
       - model_attr predicts IMPACTAttributeID
 
+    odm_mappings: records already extracted from odm_path (e.g. while it was
+    being uploaded); the file is only parsed when they are not given.
+
     Returns a dictionary containing trained sklearn models, label encoders and
     metadata under key 'metadata'.
     """
     logger.info("Starting training process")
-    odm_mappings = parse_odm_file(odm_path)
+    if odm_mappings is None:
+        odm_mappings = parse_odm_file(odm_path)
     view_mappings = parse_view_mapping_file(viewmap_path)
 
     training_records = build_training_dataset(odm_mappings, view_mappings)
@@ -140,9 +144,10 @@ def train_model(odm_path: str, viewmap_path: str) -> dict:
     return trained_model
 
 
-def predict_mappings(trained_model: dict, odm_test_path: str):
+def predict_mappings(trained_model: dict, odm_test_path: str, odm_mappings: list = None):
     logger.info(f"Predicting mappings for: {odm_test_path}")
-    odm_mappings = parse_odm_file(odm_test_path)
+    if odm_mappings is None:
+        odm_mappings = parse_odm_file(odm_test_path)
     df = pd.DataFrame(odm_mappings, dtype=str)
 
     le_se = trained_model["le_studyevent"]
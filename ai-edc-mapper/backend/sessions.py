@@ -0,0 +1,118 @@
+import json
+import os
+import re
+import time
+import uuid
+
+# Export sessions live on the local filesystem rather than in process memory so
+# that /save_mappings/ and /export_xml/ may be served by different workers.
+SESSIONS_DIR = "sessions"
+SESSION_TTL_SECONDS = int(os.environ.get("EDC_SESSION_TTL_SECONDS", 24 * 3600))
+
+_SESSION_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_UPLOAD_NAME_RE = re.compile(r"^[0-9a-f]{32}_")
+
+os.makedirs(SESSIONS_DIR, exist_ok=True)
+
+
+def _session_path(session_id):
+    return os.path.join(SESSIONS_DIR, f"{session_id}.json")
+
+
+def _write_atomic(path, data):
+    # write to a private temp file and rename it into place, so readers in
+    # other processes never observe a partially written session
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, default=str)
+    os.replace(tmp_path, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        # already removed by another worker
+        pass
+
+
+def prune_sessions(upload_folder=None, max_age=SESSION_TTL_SECONDS):
+    """
+    Delete expired sessions together with the ODM upload each one exports.
+    With upload_folder, also age out uploads older than max_age that no live
+    session references, e.g. /predict/ uploads whose mappings were never saved.
+    """
+    cutoff = time.time() - max_age
+    live_odm_paths = set()
+    expired_odm_paths = set()
+    for name in os.listdir(SESSIONS_DIR):
+        path = os.path.join(SESSIONS_DIR, name)
+        if not name.endswith(".json"):
+            # temp file left behind by a crashed writer
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    _remove(path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                session = json.load(fh)
+        except (OSError, ValueError):
+            continue
+        if session.get("created_at", 0) < cutoff:
+            expired_odm_paths.add(session.get("odm_path"))
+            _remove(path)
+        else:
+            live_odm_paths.add(session.get("odm_path"))
+
+    # several sessions may export the same upload; keep it while any is live
+    for odm_path in expired_odm_paths - live_odm_paths:
+        if odm_path:
+            _remove(odm_path)
+
+    if upload_folder is None:
+        return
+    for name in os.listdir(upload_folder):
+        path = os.path.join(upload_folder, name)
+        # only files stored by ingest.unique_upload_path ("<uuid hex>_<filename>")
+        if not _UPLOAD_NAME_RE.match(name) or path in live_odm_paths:
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                _remove(path)
+        except OSError:
+            pass
+
+
+def create_session(odm_path, mappings):
+    """
+    Persist the corrected mappings for one ODM file and return the id that
+    /export_xml/ needs to read them back.
+    """
+    session_id = uuid.uuid4().hex
+    _write_atomic(_session_path(session_id), {
+        "session_id": session_id,
+        "odm_path": odm_path,
+        "mappings": mappings,
+        "created_at": time.time(),
+    })
+    # prune only once the new session is on disk, so an expired session for
+    # the same ODM cannot take the file this one exports with it
+    prune_sessions()
+    return session_id
+
+
+def get_session(session_id):
+    """Return the stored session, or None if the id is unknown, malformed or expired."""
+    if not session_id or not _SESSION_ID_RE.match(session_id):
+        return None
+    try:
+        with open(_session_path(session_id), "r", encoding="utf-8") as fh:
+            session = json.load(fh)
+    except FileNotFoundError:
+        return None
+    # pruning only runs on create_session, so a quiet instance can still hold expired sessions
+    if time.time() - session.get("created_at", 0) > SESSION_TTL_SECONDS:
+        return None
+    return session
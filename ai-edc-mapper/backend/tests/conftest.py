@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the backend modules import each other as top-level modules (uvicorn main:app)
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTDATA_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "TestDATA")
+
+sys.path.insert(0, BACKEND_DIR)
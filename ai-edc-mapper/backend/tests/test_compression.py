@@ -0,0 +1,76 @@
+import gzip
+
+import pytest
+
+from compression import GZIP_MAGIC, ZSTD_MAGIC, StreamDecompressor, DecompressionError, negotiate_encoding
+
+zstandard = pytest.importorskip("zstandard")
+
+XML = b"<ODM>" + b"<ItemData ItemOID='IT.1'/>" * 2000 + b"</ODM>"
+HALF = len(XML) // 2
+
+
+def _gzip_frames():
+    return [gzip.compress(XML[:HALF]), gzip.compress(XML[HALF:])]
+
+
+def _zstd_frames():
+    cctx = zstandard.ZstdCompressor()
+    return [cctx.compress(XML[:HALF]), cctx.compress(XML[HALF:])]
+
+
+def _decompress(chunks):
+    decompressor = StreamDecompressor()
+    out = [decompressor.feed(chunk) for chunk in chunks]
+    out.append(decompressor.flush())
+    return b"".join(out)
+
+
+@pytest.mark.parametrize("frames", [_gzip_frames, _zstd_frames], ids=["gzip", "zstd"])
+def test_chunks_split_on_frame_boundaries(frames):
+    assert _decompress(frames()) == XML
+
+
+@pytest.mark.parametrize("frames", [_gzip_frames, _zstd_frames], ids=["gzip", "zstd"])
+def test_single_byte_chunks(frames):
+    data = b"".join(frames())
+    assert _decompress([data[i:i + 1] for i in range(len(data))]) == XML
+
+
+def test_plain_xml_passes_through():
+    assert _decompress([XML[:3], XML[3:HALF], XML[HALF:]]) == XML
+    assert _decompress([b"<a/>"]) == b"<a/>"
+
+
+@pytest.mark.parametrize("frames", [_gzip_frames, _zstd_frames], ids=["gzip", "zstd"])
+def test_truncated_input_is_rejected(frames):
+    data = b"".join(frames())
+    with pytest.raises(DecompressionError):
+        _decompress([data[:-10]])
+
+
+@pytest.mark.parametrize("magic", [GZIP_MAGIC, ZSTD_MAGIC], ids=["gzip", "zstd"])
+def test_corrupt_input_is_rejected(magic):
+    with pytest.raises(DecompressionError):
+        _decompress([magic + b"\xff" * 64])
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip, zstd", "zstd"),
+    ("zstd;q=0.5, gzip", "gzip"),
+    ("gzip;q=0.8, zstd;q=0.9", "zstd"),
+    ("GZIP", "gzip"),
+    ("gzip;q=0", None),
+    ("*", "zstd"),
+    ("*;q=0.5, gzip", "gzip"),
+    ("gzip;q=0.2, *;q=0.5", "zstd"),
+    ("*, zstd;q=0", "gzip"),
+    ("*;q=0", None),
+    ("gzip;q=bogus", None),
+])
+def test_negotiate_encoding(header, expected):
+    assert negotiate_encoding(header) == expected
@@ -0,0 +1,110 @@
+import asyncio
+import gzip
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from conftest import TESTDATA_DIR
+from ingest import ingest_multipart, IngestError
+from mapping_utils import ODMStreamParser, parse_odm_file
+
+BOUNDARY = "testboundary1234"
+ODM_PATH = os.path.join(TESTDATA_DIR, "Level1ODM.xml")
+VIEWMAP_PATH = os.path.join(TESTDATA_DIR, "Level1ViewMapping.xml")
+
+
+class FakeRequest:
+    """Just enough of starlette's Request for ingest_multipart."""
+
+    def __init__(self, body, chunk_size=65536, content_type=f"multipart/form-data; boundary={BOUNDARY}"):
+        self.headers = {"content-type": content_type}
+        self._body = body
+        self._chunk_size = chunk_size
+
+    async def stream(self):
+        for start in range(0, len(self._body), self._chunk_size):
+            yield self._body[start:start + self._chunk_size]
+
+
+def _part(name, filename, data):
+    return (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + data + b"\r\n"
+
+
+def _body(*parts):
+    return b"".join(parts) + f"--{BOUNDARY}--\r\n".encode()
+
+
+def _read(path):
+    with open(path, "rb") as fh:
+        return fh.read()
+
+
+def _ingest(request, upload_folder):
+    return asyncio.run(ingest_multipart(request, str(upload_folder), {"odm": ODMStreamParser}))
+
+
+@pytest.mark.parametrize("chunk_size", [65536, 7], ids=["large-chunks", "split-parts"])
+def test_files_are_stored_and_parsed(tmp_path, chunk_size):
+    odm, viewmap = _read(ODM_PATH), _read(VIEWMAP_PATH)
+    request = FakeRequest(_body(_part("odm", "odm.xml", odm), _part("viewmap", "view.xml", viewmap)), chunk_size)
+
+    files = _ingest(request, tmp_path)
+
+    assert _read(files["odm"].path) == odm
+    assert _read(files["viewmap"].path) == viewmap
+    assert files["odm"].records == parse_odm_file(ODM_PATH)
+    assert files["viewmap"].records is None
+    assert files["odm"].filename == "odm.xml"
+
+
+def test_compressed_upload_is_stored_as_sent(tmp_path):
+    odm = gzip.compress(_read(ODM_PATH))
+    files = _ingest(FakeRequest(_body(_part("odm", "odm.xml.gz", odm)), 1000), tmp_path)
+
+    assert _read(files["odm"].path) == odm
+    assert files["odm"].records == parse_odm_file(ODM_PATH)
+
+
+def test_missing_field_is_absent(tmp_path):
+    files = _ingest(FakeRequest(_body(_part("viewmap", "view.xml", _read(VIEWMAP_PATH)))), tmp_path)
+
+    assert "odm" not in files
+    assert list(files) == ["viewmap"]
+
+
+def test_repeated_field_keeps_the_first(tmp_path):
+    body = _body(_part("odm", "first.xml", _read(ODM_PATH)), _part("odm", "second.xml", b"<ODM/>"))
+    files = _ingest(FakeRequest(body), tmp_path)
+
+    assert files["odm"].filename == "first.xml"
+    assert files["odm"].records == parse_odm_file(ODM_PATH)
+    assert os.listdir(tmp_path) == [os.path.basename(files["odm"].path)]
+
+
+def test_non_multipart_request_is_rejected(tmp_path):
+    with pytest.raises(IngestError):
+        _ingest(FakeRequest(b"{}", content_type="application/json"), tmp_path)
+
+
+@pytest.mark.parametrize("odm, error", [
+    (b"<ODM><SubjectData></ODM>", ET.ParseError),
+    (gzip.compress(b"<ODM/>")[:-8] + b"\xff" * 8, IngestError),
+], ids=["invalid-xml", "corrupt-gzip"])
+def test_failed_parse_discards_uploads(tmp_path, odm, error):
+    body = _body(_part("viewmap", "view.xml", _read(VIEWMAP_PATH)), _part("odm", "odm.xml", odm))
+    with pytest.raises(error):
+        _ingest(FakeRequest(body), tmp_path)
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("tail", [b"", b"--" + BOUNDARY.encode() + b"\r\ngarbage"], ids=["truncated", "garbage"])
+def test_malformed_body_discards_uploads(tmp_path, tail):
+    body = _part("odm", "odm.xml", _read(ODM_PATH)) + tail
+    with pytest.raises(IngestError):
+        _ingest(FakeRequest(body, 1000), tmp_path)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,25 @@
+import multiprocessing
+
+import knowledgebase
+
+WORKERS = 4
+MAPPINGS_PER_WORKER = 50
+
+
+def _add_mappings(worker):
+    for i in range(MAPPINGS_PER_WORKER):
+        knowledgebase.add_user_mapping({"worker": worker, "i": i})
+
+
+def test_concurrent_writers_do_not_lose_updates(tmp_path, monkeypatch):
+    # the workers are forked, so they inherit the working directory
+    monkeypatch.chdir(tmp_path)
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_add_mappings, args=(w,)) for w in range(WORKERS)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+        assert proc.exitcode == 0
+
+    assert len(knowledgebase.get_all_user_mappings()) == WORKERS * MAPPINGS_PER_WORKER
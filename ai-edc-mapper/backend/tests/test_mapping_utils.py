@@ -0,0 +1,62 @@
+import glob
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from conftest import TESTDATA_DIR
+from mapping_utils import ODMStreamParser, parse_odm_file
+
+
+def _reference_parse(file_path):
+    # the DOM-based parse_odm_file that ODMStreamParser replaced
+    root = ET.parse(file_path).getroot()
+    ns = {'ns': root.tag[root.tag.find("{")+1:root.tag.find("}")]} if "{" in root.tag else {}
+    odm_mappings = []
+    for subject in root.findall(".//ns:SubjectData", ns) if ns else root.findall(".//SubjectData"):
+        subject_key = subject.attrib.get("SubjectKey")
+        for study_event in subject.findall(".//ns:StudyEventData", ns) if ns else subject.findall(".//StudyEventData"):
+            study_event_oid = study_event.attrib.get("StudyEventOID")
+            study_event_repeat_key = study_event.attrib.get("StudyEventRepeatKey")
+            for form_data in study_event.findall(".//ns:FormData", ns) if ns else study_event.findall(".//FormData"):
+                for item_group in form_data.findall(".//ns:ItemGroupData", ns) if ns else form_data.findall(".//ItemGroupData"):
+                    for item_data in item_group.findall(".//ns:ItemData", ns) if ns else item_group.findall(".//ItemData"):
+                        item_oid = item_data.attrib.get("ItemOID")
+                        if study_event_oid and item_oid:
+                            odm_mappings.append({
+                                "SubjectKey": subject_key,
+                                "StudyEventOID": study_event_oid,
+                                "StudyEventRepeatKey": study_event_repeat_key,
+                                "ItemOID": item_oid
+                            })
+    return odm_mappings
+
+
+def _stream_parse(file_path, chunk_size=997):
+    with open(file_path, "rb") as fh:
+        data = fh.read()
+    parser = ODMStreamParser()
+    for start in range(0, len(data), chunk_size):
+        parser.feed(data[start:start + chunk_size])
+    return parser.close()
+
+
+def _outcome(parse, file_path):
+    # TestODM2.xml is not well-formed; both parsers must reject it
+    try:
+        return parse(file_path)
+    except ET.ParseError:
+        return ET.ParseError
+
+
+TESTDATA_FILES = sorted(glob.glob(os.path.join(TESTDATA_DIR, "*.xml")))
+
+
+@pytest.mark.parametrize("path", TESTDATA_FILES, ids=os.path.basename)
+def test_parse_odm_file_matches_reference(path):
+    assert _outcome(parse_odm_file, path) == _outcome(_reference_parse, path)
+
+
+@pytest.mark.parametrize("path", TESTDATA_FILES, ids=os.path.basename)
+def test_stream_parser_matches_reference_in_small_chunks(path):
+    assert _outcome(_stream_parse, path) == _outcome(_reference_parse, path)
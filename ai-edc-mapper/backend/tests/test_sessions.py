@@ -0,0 +1,67 @@
+import json
+import os
+import time
+
+import pytest
+
+import sessions
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(sessions.SESSIONS_DIR)
+    os.makedirs("uploads")
+    return tmp_path
+
+
+def _upload(name, age=0):
+    path = os.path.join("uploads", name)
+    with open(path, "w") as fh:
+        fh.write("<ODM/>")
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+def _expire(session_id):
+    path = sessions._session_path(session_id)
+    with open(path) as fh:
+        session = json.load(fh)
+    session["created_at"] -= sessions.SESSION_TTL_SECONDS + 1
+    with open(path, "w") as fh:
+        json.dump(session, fh)
+
+
+def test_expired_session_is_rejected(workdir):
+    session_id = sessions.create_session(_upload("a" * 32 + "_ODM.xml"), [])
+    assert sessions.get_session(session_id) is not None
+    _expire(session_id)
+    assert sessions.get_session(session_id) is None
+
+
+def test_prune_removes_expired_sessions_and_stale_uploads(workdir):
+    old = sessions.SESSION_TTL_SECONDS + 10
+    expired_odm = _upload("1" * 32 + "_ODM.xml", age=old)
+    shared_odm = _upload("2" * 32 + "_ODM.xml", age=old)
+    unsaved_odm = _upload("3" * 32 + "_ODM.xml", age=old)
+    fresh_odm = _upload("4" * 32 + "_ODM.xml")
+    legacy = _upload("ODM.xml", age=old)
+
+    expired = sessions.create_session(expired_odm, [])
+    _expire(expired)
+    shared_expired = sessions.create_session(shared_odm, [])
+    _expire(shared_expired)
+    shared_live = sessions.create_session(shared_odm, [])
+
+    sessions.prune_sessions("uploads")
+
+    assert not os.path.exists(sessions._session_path(expired))
+    assert not os.path.exists(expired_odm)
+    assert not os.path.exists(unsaved_odm)
+    # still exported by a live session
+    assert os.path.exists(shared_odm)
+    assert sessions.get_session(shared_live) is not None
+    assert os.path.exists(fresh_odm)
+    # not written by unique_upload_path
+    assert os.path.exists(legacy)
@@ -0,0 +1,40 @@
+import gzip
+import os
+
+import pytest
+
+from conftest import TESTDATA_DIR
+from mapping_utils import parse_odm_file
+from xml_updater import update_odm_xml
+
+zstandard = pytest.importorskip("zstandard")
+
+ODM_PATH = os.path.join(TESTDATA_DIR, "ODM.xml")
+
+
+def _export(encoding=None, mappings=()):
+    return b"".join(update_odm_xml(ODM_PATH, list(mappings), encoding=encoding))
+
+
+def test_compressed_exports_match_plain_export():
+    plain = _export()
+    assert plain.startswith(b"<?xml")
+    assert gzip.decompress(_export("gzip")) == plain
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(_export("zstd")) == plain
+
+
+def test_mappings_are_applied():
+    record = parse_odm_file(ODM_PATH)[0]
+    data = gzip.decompress(_export("gzip", [{
+        "StudyEventOID": record["StudyEventOID"],
+        "ItemOID": record["ItemOID"],
+        "IMPACTVisitID": "V1",
+        "IMPACTAttributeID": "A1",
+    }]))
+    assert b'IMPACTVisitID="V1"' in data
+    assert b'IMPACTAttributeID="A1"' in data
+
+
+def test_unsupported_encoding_is_raised_while_streaming():
+    with pytest.raises(ValueError):
+        _export("brotli")
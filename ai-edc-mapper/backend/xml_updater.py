@@ -1,14 +1,28 @@
 import xml.etree.ElementTree as ET
-import io
+import queue
+import threading
 from fastapi.responses import StreamingResponse
+from compression import open_xml, compressing_writer
 
+CHUNK_SIZE = 64 * 1024
+# chunks the serializer may run ahead of the client
+QUEUE_SIZE = 16
 
-def update_odm_xml(odm_file_path, updated_mappings):
-    tree = ET.parse(odm_file_path)
+
+def update_odm_xml(odm_file_path, updated_mappings, encoding=None):
+    """
+    Apply updated_mappings to the ODM file and return an iterator over the
+    serialized XML. The file is parsed and updated before this returns, so
+    those errors reach the caller; serialization, and with encoding ("gzip" or
+    "zstd") compression, happens chunk by chunk while the iterator is consumed,
+    so neither the uncompressed nor the compressed output is held in memory.
+    """
+    with open_xml(odm_file_path) as fh:
+        tree = ET.parse(fh)
     root = tree.getroot()
 
     # Build mapping lookup
-    mapping_index = {(um['StudyEventOID'], um['ItemOID']): (um['IMPACTVisitID'], um['IMPACTAttributeID'])
+    mapping_index = {(um['StudyEventOID'], um['ItemOID']): (um.get('IMPACTVisitID'), um.get('IMPACTAttributeID'))
                      for um in updated_mappings}
 
     nsmap = {}
@@ -25,15 +39,101 @@ def update_odm_xml(odm_file_path, updated_mappings):
                     key = (sed_oid, item_oid)
                     if key in mapping_index:
                         impact_visit_id, impact_attr_id = mapping_index[key]
-                        item_data.set("IMPACTVisitID", impact_visit_id)
-                        item_data.set("IMPACTAttributeID", impact_attr_id)
+                        # rows added from the unmapped list carry only a visit
+                        if impact_visit_id is not None:
+                            item_data.set("IMPACTVisitID", impact_visit_id)
+                        if impact_attr_id is not None:
+                            item_data.set("IMPACTAttributeID", impact_attr_id)
+
+    return _serialize(tree, encoding)
+
+
+class _ChunkSink:
+    """Writable file object that hands what is written to it on in CHUNK_SIZE pieces."""
+
+    def __init__(self, chunks, abandoned):
+        self._chunks = chunks
+        self._abandoned = abandoned
+        self._buf = bytearray()
+
+    def write(self, data):
+        self._buf += data
+        if len(self._buf) >= CHUNK_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._buf:
+            self.put(bytes(self._buf))
+            self._buf.clear()
+
+    def put(self, item):
+        while True:
+            if self._abandoned.is_set():
+                raise _Abandoned()
+            try:
+                self._chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+
+class _Abandoned(Exception):
+    """The response was closed before the document was fully written."""
+
+
+_DONE = object()
+
+
+def _serialize(tree, encoding):
+    # ElementTree.write pushes the whole document in one call, so it runs in a
+    # thread and the generator yields the chunks it produces as they arrive
+    chunks = queue.Queue(maxsize=QUEUE_SIZE)
+    abandoned = threading.Event()
+
+    def write():
+        sink = _ChunkSink(chunks, abandoned)
+        try:
+            if encoding is None:
+                tree.write(sink, encoding='utf-8', xml_declaration=True)
+            else:
+                with compressing_writer(sink, encoding) as out:
+                    tree.write(out, encoding='utf-8', xml_declaration=True)
+            sink.flush()
+            sink.put(_DONE)
+        except _Abandoned:
+            pass
+        except Exception as e:
+            try:
+                sink.put(e)
+            except _Abandoned:
+                pass
 
-    buf = io.BytesIO()
-    tree.write(buf, encoding='utf-8', xml_declaration=True)
-    return buf.getvalue()
+    writer = threading.Thread(target=write, name="export-serializer", daemon=True)
+    writer.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # the client may disconnect mid-download; let the writer stop too
+        abandoned.set()
 
 
-def get_update_response(xml_bytes, filename="updated_odm.xml"):
-    response = StreamingResponse(io.BytesIO(xml_bytes), media_type="application/xml")
+def get_update_response(xml_chunks, filename="updated_odm.xml", media_type="application/xml",
+                        content_encoding=None):
+    """
+    Stream xml_chunks (as returned by update_odm_xml) as a download. content_encoding marks a body that the
+    client decodes transparently (negotiated via Accept-Encoding); a compressed
+    file download instead passes its own media_type and filename.
+    """
+    response = StreamingResponse(xml_chunks, media_type=media_type)
     response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    response.headers["Vary"] = "Accept-Encoding"
+    if content_encoding is not None:
+        response.headers["Content-Encoding"] = content_encoding
     return response
@@ -27,7 +27,7 @@ export default function App() {
 
   const trainer = useTrainer(apiBase, addActivity, updateKnowledgeStats, setModelReady, setStatusMsg, setLoading, setError);
   const predictor = usePredictor(apiBase, addActivity, updateKnowledgeStats, setLoading, setError, setStatusMsg);
-  const validator = useValidator(apiBase, addActivity, updateKnowledgeStats, setLoading, setError, setStatusMsg);
+  const validator = useValidator(apiBase, addActivity, updateKnowledgeStats, setLoading, setError, setStatusMsg, predictor.exportSessionId);
 
   const [modalVisible, setModalVisible] = useState(false);
   const [activeMapping, setActiveMapping] = useState(null);
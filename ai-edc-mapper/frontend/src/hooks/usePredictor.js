@@ -8,12 +8,14 @@ export const usePredictor = (apiBase, addActivity, updateKnowledgeStats, setLoad
   const [groupedUnmapped, setGroupedUnmapped] = useState([]);
   const [editableMappingsState, setEditableMappingsState] = useState([]);
   const [currentOdmFileName, setCurrentOdmFileName] = useState(null);
+  const [storedOdmFileName, setStoredOdmFileName] = useState(null);
+  const [exportSessionId, setExportSessionId] = useState(null);
 
   const testProps = {
     beforeUpload: (file) => { setTestFile(file); return false; },
     fileList: testFile ? [testFile] : [],
     onRemove: () => setTestFile(null),
-    accept: '.xml'
+    accept: '.xml,.gz,.zst'
   };
 
   const handlePredict = async () => {
@@ -49,6 +51,7 @@ export const usePredictor = (apiBase, addActivity, updateKnowledgeStats, setLoad
       setGroupedUnmapped(Object.values(groups));
       setEditableMappingsState(data.mapped.map((m, i) => ({ key: i, ...m })));
       setCurrentOdmFileName(testFile.name);
+      setStoredOdmFileName(data.odm_filename);
       addActivity('predict', `Predicted mappings for ${testFile.name} (${data.mapped.length})`);
       updateKnowledgeStats({ mappings: (prev) => prev.mappings + (data.mapped.length || 0) });
       setStatusMsg('Predictions ready');
@@ -93,13 +96,15 @@ export const usePredictor = (apiBase, addActivity, updateKnowledgeStats, setLoad
 
     setLoading(true); setError(null);
     try {
-      const resp = await fetch(`${apiBase}/save_mappings/`, {
+      // the endpoint takes the mappings list as the body and the file name as a query parameter
+      const resp = await fetch(`${apiBase}/save_mappings/?odm_filename=${encodeURIComponent(storedOdmFileName)}`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ mappings: allToSave, odm_filename: currentOdmFileName })
+        body: JSON.stringify(allToSave)
       });
       const data = await resp.json();
       if (!resp.ok) throw new Error(data.error || 'Save failed');
+      setExportSessionId(data.session_id);
 
       addActivity('save', `Saved mappings for ${currentOdmFileName}`);
       message.success('Mappings saved');
@@ -126,6 +131,7 @@ export const usePredictor = (apiBase, addActivity, updateKnowledgeStats, setLoad
     editableMappings: editableMappingsState,
     setEditableMappings,
     currentOdmFileName,
+    exportSessionId,
     handlePredict,
     handleUnmappedEdit,
     handleActionChange,
@@ -1,7 +1,7 @@
 import { useState } from 'react';
 import { message } from 'antd';
 
-export const useValidator = (apiBase, addActivity, updateKnowledgeStats, setLoading, setError, setStatusMsg) => {
+export const useValidator = (apiBase, addActivity, updateKnowledgeStats, setLoading, setError, setStatusMsg, exportSessionId) => {
   const [userViewmapFile, setUserViewmapFile] = useState(null);
   const [validationResult, setValidationResult] = useState([]);
 
@@ -9,7 +9,7 @@ export const useValidator = (apiBase, addActivity, updateKnowledgeStats, setLoad
     beforeUpload: (file) => { setUserViewmapFile(file); return false; },
     fileList: userViewmapFile ? [userViewmapFile] : [],
     onRemove: () => setUserViewmapFile(null),
-    accept: '.xml'
+    accept: '.xml,.gz,.zst'
   };
 
   const handleValidate = async () => {
@@ -41,8 +41,9 @@ export const useValidator = (apiBase, addActivity, updateKnowledgeStats, setLoad
   };
 
   const exportUpdatedXml = async () => {
+    if (!exportSessionId) return message.error('Save mappings before exporting');
     try {
-      const resp = await fetch(`${apiBase}/export_xml/`);
+      const resp = await fetch(`${apiBase}/export_xml/?session_id=${encodeURIComponent(exportSessionId)}`);
       if (!resp.ok) throw new Error('Export failed');
       const blob = await resp.blob();
       const url = URL.createObjectURL(blob);